@@ -48,6 +48,8 @@ class GraspNode(Node):
         self.delay_client = self.create_client(
             DelayTime, "delay", callback_group=ReentrantCallbackGroup()
         )
+        # pause to let the handle tf settle, reused for every delay call
+        self.settle_delay = DelayTime.Request(time=3.0)
         self.grasp_planner = GraspPlanner(self.moveit_api, "panda_gripper/grasp")
 
         self.payloads = {
@@ -83,7 +85,7 @@ class GraspNode(Node):
             orientation=observe_pose.orientation,
             execute=True,
         )
-        await self.delay_client.call_async(DelayTime.Request(time=3.0))
+        await self.delay_client.call_async(self.settle_delay)
 
         # get the handle tf
         handle_tf = self.buffer.lookup_transform(
@@ -103,7 +105,7 @@ class GraspNode(Node):
             orientation=refinement_point.orientation,
             execute=True,
         )
-        await self.delay_client.call_async(DelayTime.Request(time=3.0))
+        await self.delay_client.call_async(self.settle_delay)
         handle_tf = self.buffer.lookup_transform(
             "panda_link0", "handle", time=Time(seconds=0.0)
         )
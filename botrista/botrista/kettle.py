@@ -1,16 +1,18 @@
 """
 Node for kettle management.
 
-Uses the wrapper class made in moveitapi. 
-
-Service Clients:
-  + delay (botrista_interfaces/DelayTime) - Delay timer
+Uses the wrapper class made in moveitapi. The pouring node is run in the
+same process, since this node is the only user of its pour_action server.
 
 Action Servers:
   + pick_kettle (botrista_interfaces/Emptyaction) - pick up the kettle
   + place_kettle (botrista_interfaces/Emptyaction) - place the kettle
   + pour_kettle (botrista_interfaces/Emptyaction) - pour water from the kettle
 
+  Only one kettle action runs at a time: a pick_kettle, place_kettle or
+  pour_kettle goal sent while another is still running is rejected, so
+  clients should check goal_handle.accepted before awaiting the result.
+
 Action Clients:
   + pour_action (botrista_interfaces/PourAction) - Action for pouring in a spiral motion
   + grasp_process (botrista_interfaces/GraspProcess) - Action for detectinig and grasping an object
@@ -19,23 +21,113 @@ Action Clients:
 
 import rclpy
 from rclpy.node import Node
+from rclpy.executors import MultiThreadedExecutor
 import tf2_geometry_msgs
-from tf2_ros import Buffer, TransformListener
+from tf2_ros import Buffer, TransformListener, TransformException
 from moveit_wrapper.moveitapi import MoveItApi
 from moveit_wrapper.grasp_planner import GraspPlan, GraspPlanner
+from moveit_msgs.msg import MoveItErrorCodes, RobotTrajectory
 from geometry_msgs.msg import Pose, Point, Quaternion, TransformStamped, Transform, Vector3
 from std_msgs.msg import Header
-from rclpy.callback_groups import ReentrantCallbackGroup
+from rclpy.callback_groups import (
+    CallbackGroup,
+    ReentrantCallbackGroup,
+    MutuallyExclusiveCallbackGroup
+)
 from franka_msgs.action import Grasp
 from rclpy.time import Time
+from rclpy.duration import Duration
+from rclpy.task import Future
 from franka_msgs.msg import GraspEpsilon
-from rclpy.callback_groups import ReentrantCallbackGroup
 from botrista_interfaces.action import EmptyAction, GraspProcess, PourAction
-from rclpy.action import ActionServer, ActionClient
-from botrista_interfaces.srv import DelayTime
+from rclpy.action import ActionServer, ActionClient, GoalResponse
+from rclpy.qos import QoSProfile, HistoryPolicy
+from botrista.transforms import tf_to_mat, transform_pose
+from botrista.pouring import Pouring
 import numpy as np
 
 
+# Spiral pours, starting from the outside for the first pour only. These are
+# never modified; send_goal_async only wraps them in a new request
+_POUR_GOAL_OUT = PourAction.Goal(
+    num_points=100,
+    spiral_radius=0.02,
+    num_loops=2.0,
+    start_outside=True,
+    pour_frame="panda_hand_tcp",
+)
+_POUR_GOAL_IN = PourAction.Goal(
+    num_points=100,
+    spiral_radius=0.02,
+    num_loops=2.0,
+    start_outside=False,
+    pour_frame="panda_hand_tcp",
+)
+
+
+def sleep_for(node: Node, seconds: float, callback_group: CallbackGroup) -> Future:
+    """
+    Start a non-blocking sleep on the node's clock.
+
+    Args:
+        node (rclpy.node.Node) -- node used to create the timer
+        seconds (float) -- time to sleep for
+        callback_group (rclpy.callback_groups.CallbackGroup) -- group for the timer
+
+    Returns:
+        rclpy.task.Future -- done once the time has passed, cancel it to stop the timer
+
+    """
+    future = Future()
+
+    def wake():
+        if not future.done():
+            future.set_result(None)
+
+    def cleanup(_):
+        timer.cancel()
+        node.destroy_timer(timer)
+
+    timer = node.create_timer(seconds, wake, callback_group=callback_group)
+    future.add_done_callback(cleanup)
+    return future
+
+
+async def wait_for(node: Node, future: Future, timeout_sec: float,
+                   callback_group: CallbackGroup) -> bool:
+    """
+    Await an rclpy future, giving up if it takes too long.
+
+    Args:
+        node (rclpy.node.Node) -- node used to create the timeout timer
+        future (rclpy.task.Future) -- future to wait on
+        timeout_sec (float) -- time to wait before giving up
+        callback_group (rclpy.callback_groups.CallbackGroup) -- group for the timer
+
+    Returns:
+        True if the future finished before the timeout
+
+    """
+    if future.done():
+        return True
+
+    either = Future()
+
+    def finish(_):
+        if not either.done():
+            either.set_result(None)
+
+    future.add_done_callback(finish)
+    timeout = sleep_for(node, timeout_sec, callback_group)
+    timeout.add_done_callback(finish)
+    await either
+
+    # stop the timeout timer if the future finished first
+    if not timeout.done():
+        timeout.cancel()
+    return future.done()
+
+
 class Kettle(Node):
 
     def __init__(self):
@@ -44,41 +136,69 @@ class Kettle(Node):
         self.kettle_actual_place = TransformStamped()
         self.buffer = Buffer()
         self.listener = TransformListener(self.buffer, self)
+
+        # last transform found for each (parent, child) frame pair
+        self.tf_cache = {}
+        self.tf_cache_timeout = Duration(seconds=0.5)
+        self.tf_lookup_timeout = 1.0
         self.moveit_api = MoveItApi(
             self, "panda_link0", "panda_hand_tcp", "panda_manipulator", "/franka/joint_states")
         self.grasp_planner = GraspPlanner(
             self.moveit_api, "panda_gripper/grasp")
 
-        self.delay_client = self.create_client(
-            DelayTime, "delay", callback_group=ReentrantCallbackGroup()
-        )
+        # the action servers all move the robot, so goal_cb rejects new goals
+        # while one is running. server_grp serializes goal handling so that
+        # check can't race; the execute callbacks run as separate tasks
+        # outside it, and the clients they await are serviced in client_grp
+        self.busy = False
+        self.server_grp = MutuallyExclusiveCallbackGroup()
+        self.client_grp = ReentrantCallbackGroup()
+
+        # feedback from the action clients is never read, so don't queue it
+        self.feedback_qos = QoSProfile(history=HistoryPolicy.KEEP_LAST, depth=1)
+
         self.pick_kettle_client = ActionServer(self,
                                                EmptyAction,
                                                "pick_kettle",
-                                               self.pick_kettle_cb,
-                                               callback_group=ReentrantCallbackGroup())
+                                               self.exclusive(self.pick_kettle_cb),
+                                               goal_callback=self.goal_cb,
+                                               callback_group=self.server_grp)
         self.place_kettle_client = ActionServer(self,
                                                 EmptyAction,
                                                 "place_kettle",
-                                                self.place_kettle_cb,
-                                                callback_group=ReentrantCallbackGroup())
+                                                self.exclusive(self.place_kettle_cb),
+                                                goal_callback=self.goal_cb,
+                                                callback_group=self.server_grp)
         self.pour_kettle_server = ActionServer(self,
                                                EmptyAction,
                                                "pour_kettle",
-                                               self.pour_kettle_cb,
-                                               callback_group=ReentrantCallbackGroup())
+                                               self.exclusive(self.pour_kettle_cb),
+                                               goal_callback=self.goal_cb,
+                                               callback_group=self.server_grp)
         self.grasp_process = ActionClient(self,
                                           GraspProcess,
                                           'grasp_process',
-                                          callback_group=ReentrantCallbackGroup())
+                                          feedback_sub_qos_profile=self.feedback_qos,
+                                          callback_group=self.client_grp)
 
         self.pour_kettle = ActionClient(self,
                                         PourAction,
                                         'pour_action',
-                                        callback_group=ReentrantCallbackGroup())
-
-        while not self.delay_client.wait_for_service(timeout_sec=2.0):
-            self.get_logger().warn("Waiting for delay service")
+                                        feedback_sub_qos_profile=self.feedback_qos,
+                                        callback_group=self.client_grp)
+
+        # find the action servers once up front rather than on the first goal
+        for name, client in (("grasp_process", self.grasp_process),
+                             ("pour_action", self.pour_kettle)):
+            if not client.wait_for_server(timeout_sec=5.0):
+                self.get_logger().warn(f"{name} action server not available yet")
+
+        # home joint positions, and the last trajectory planned to them
+        self.home_joints = ["panda_joint1", "panda_joint2", "panda_joint3",
+                            "panda_joint4", "panda_joint5", "panda_joint6", "panda_joint7"]
+        self.home_positions = [0.0, -np.pi / 4.0, 0.0, -3*np.pi / 4.0,
+                               0.0, np.pi / 2.0, np.pi / 4.0]
+        self.home_traj = None
 
         self.observe_pose = Pose(
             position=Point(x=0.0, y=0.0, z=0.40),
@@ -95,22 +215,165 @@ class Kettle(Node):
         self.retreat_pose = Pose(
             position=Point(x=0.03, y=0.0, z=-0.10),
             orientation=Quaternion())
+        self.refinement_pose = Pose(
+            position=Point(x=0.0, y=0.0, z=-0.15),
+            orientation=Quaternion())
+
+        # place points in the frame the kettle was grasped at
+        self.place_approach_pose = Pose(
+            position=Point(x=0.0, y=0.0, z=-0.1),
+            orientation=Quaternion())
+        self.place_grasp_pose = Pose(
+            position=Point(x=0.0, y=0.0, z=-0.02),
+            orientation=Quaternion())
+        self.place_retreat_pose = Pose(
+            position=Point(x=0.0, y=0.0, z=-0.1),
+            orientation=Quaternion())
+
+        # pour points in the spout frame
+        self.spout_mat = tf_to_mat(TransformStamped(
+            header=Header(frame_id="panda_link0"),
+            transform=Transform(
+                translation=Vector3(x=-0.23, y=0.0, z=0.02),
+                rotation=Quaternion()
+            )
+        ))
+        self.pour_approach_pose = Pose(
+            position=Point(x=-0.01, y=0.0, z=0.20),
+            orientation=Quaternion(
+                x=1.0, y=0.0, z=0.0, w=0.0))
+        self.pour_pose = Pose(
+            position=Point(x=0.01, y=-0.005, z=0.17),
+            orientation=Quaternion(
+                x=0.9452608, y=0.0, z=-0.3150869, w=-0.0848662))
+
+    async def lookup_transform_cached(self, parent: str, child: str) -> TransformStamped:
+        """
+        Look up a transform, reusing the last result if it is recent enough.
+
+        If the transform is not available within tf_lookup_timeout, the last
+        result is used regardless of its age.
+
+        Args:
+            parent (str) -- parent frame
+            child (str) -- child frame
+
+        Returns:
+            geometry_msgs/TransformStamped -- transform from parent to child
+
+        Raises:
+            TransformException -- if the lookup fails and nothing is cached
+
+        """
+        now = self.get_clock().now()
+        cached = self.tf_cache.get((parent, child))
+        if cached is not None and now - cached[0] < self.tf_cache_timeout:
+            return cached[1]
+
+        try:
+            ready = self.buffer.wait_for_transform_async(parent, child, Time())
+            if not await wait_for(self, ready, self.tf_lookup_timeout,
+                                  self.client_grp):
+                # completing the future removes its callback from the buffer
+                ready.cancel()
+                raise TransformException(
+                    f"Timed out waiting for transform to {child}")
+            tf = self.buffer.lookup_transform(parent, child, Time())
+        except TransformException:
+            if cached is None:
+                raise
+            self.get_logger().warn(f"Using cached transform to {child}")
+            return cached[1]
+
+        self.tf_cache[(parent, child)] = (now, tf)
+        return tf
+
+    def goal_cb(self, goal_request):
+        """Reject kettle goals while another kettle action is running."""
+        if self.busy:
+            self.get_logger().warn("Kettle is busy, rejecting goal")
+            return GoalResponse.REJECT
+        self.busy = True
+        return GoalResponse.ACCEPT
+
+    def exclusive(self, execute_cb):
+        """
+        Wrap an execute callback so the node is no longer busy once it ends.
+
+        Args:
+            execute_cb (coroutine function) -- action server execute callback
+
+        Returns:
+            The wrapped execute callback
+
+        """
+        async def execute(goal_handle):
+            try:
+                return await execute_cb(goal_handle)
+            finally:
+                self.busy = False
+        return execute
+
+    def at_trajectory_start(self, traj: RobotTrajectory) -> bool:
+        """
+        Check if the robot is where a trajectory starts.
+
+        Args:
+            traj (moveit_msgs/RobotTrajectory) -- trajectory to check
+
+        Returns:
+            True if every joint is within 0.01 rad of the first trajectory point
+
+        """
+        points = traj.joint_trajectory.points
+        if not points:
+            return False
+        joint_states = self.moveit_api.get_current_joint_state()
+        current = [joint_states.get(name, np.nan)
+                   for name in traj.joint_trajectory.joint_names]
+        return np.allclose(current, points[0].positions, atol=0.01)
+
+    async def execute(self, traj: RobotTrajectory) -> bool:
+        """
+        Execute a trajectory and wait for it to finish.
+
+        Args:
+            traj (moveit_msgs/RobotTrajectory) -- trajectory to execute
+
+        Returns:
+            True if the trajectory was executed successfully
+
+        """
+        goal = await self.moveit_api.execute_trajectory(traj)
+        if not goal.accepted:
+            return False
+        res = await goal.get_result_async()
+        return res.result.error_code.val == MoveItErrorCodes.SUCCESS
 
     async def pick_kettle_cb(self, goal_handle):
         """Grab the kettle from its stand."""
-        # home the panda
-        await self.moveit_api.plan_joint_async(
-            ["panda_joint1", "panda_joint2", "panda_joint3",
-                "panda_joint4", "panda_joint5", "panda_joint6", "panda_joint7"],
-            [0.0, -np.pi / 4.0, 0.0, -3*np.pi / 4.0, 0.0, np.pi / 2.0, np.pi / 4.0],
-            execute=True
-        )
+        # home the panda, replanning only if it isn't where the last plan started
+        home_traj = self.home_traj
+        if home_traj is None or not self.at_trajectory_start(home_traj):
+            result = await self.moveit_api.plan_joint_async(
+                self.home_joints,
+                self.home_positions,
+                execute=False
+            )
+            home_traj = result.trajectory
+
+        # only keep trajectories that were planned and executed successfully
+        if home_traj.joint_trajectory.points and await self.execute(home_traj):
+            self.home_traj = home_traj
+        else:
+            self.get_logger().warn("Failed to home the panda")
+            self.home_traj = None
 
         # TFs
         # pour_over_tag
         try:
-            tf = self.buffer.lookup_transform(
-                "panda_link0", "filtered_kettle_tag", Time())
+            tf = await self.lookup_transform_cached(
+                "panda_link0", "filtered_kettle_tag")
 
         except Exception as e:
             self.get_logger().error("No transform found")
@@ -119,13 +382,9 @@ class Kettle(Node):
         observe_pose = tf2_geometry_msgs.do_transform_pose(
             self.observe_pose, tf)
 
-        refinement_pose = Pose(
-            position=Point(x=0.0, y=0.0, z=-0.15),
-            orientation=Quaternion())
-
         goal_msg = GraspProcess.Goal(
             observe_pose=observe_pose,
-            refinement_pose=refinement_pose,
+            refinement_pose=self.refinement_pose,
             approach_pose=self.approach_pose,
             grasp_pose=self.grasp_pose,
             width=0.03,
@@ -146,27 +405,10 @@ class Kettle(Node):
 
     async def place_kettle_cb(self, goal_handle):
         """Place the kettle on its stand."""
-        approach_pose = Pose(
-            position=Point(x=0.0, y=0.0, z=-0.1),
-            orientation=Quaternion()
-        )
-
-        grasp_pose = Pose(
-            position=Point(x=0.0, y=0.0, z=-0.02),
-            orientation=Quaternion()
-        )
-
-        retreat_pose = Pose(
-            position=Point(x=0.0, y=0.0, z=-0.1),
-            orientation=Quaternion()
-        )
-
-        approach_pose = tf2_geometry_msgs.do_transform_pose(
-            approach_pose, self.kettle_actual_place)
-        grasp_pose = tf2_geometry_msgs.do_transform_pose(
-            grasp_pose, self.kettle_actual_place)
-        retreat_pose = tf2_geometry_msgs.do_transform_pose(
-            retreat_pose, self.kettle_actual_place)
+        place_mat = tf_to_mat(self.kettle_actual_place)
+        approach_pose = transform_pose(self.place_approach_pose, place_mat)
+        grasp_pose = transform_pose(self.place_grasp_pose, place_mat)
+        retreat_pose = transform_pose(self.place_retreat_pose, place_mat)
 
         grasp_plan = GraspPlan(
             approach_pose=approach_pose,
@@ -195,162 +437,55 @@ class Kettle(Node):
             EmptyAction.Result -- Result of the action
         """
         try:
-            pot_top_tf = self.buffer.lookup_transform(
-                "panda_link0", "pot_top", Time())
+            pot_top_tf = await self.lookup_transform_cached(
+                "panda_link0", "pot_top")
         except Exception as e:
             self.get_logger().error("No transform found")
             return
 
-        tf = TransformStamped(
-            header=Header(
-                frame_id="panda_link0",
-                stamp=self.get_clock().now().to_msg()
-            ),
-            transform=Transform(
-                translation=Vector3(x=-0.23, y=0.0, z=0.02),
-                rotation=Quaternion()
-            )
-        )
-
-        approach_pose = Pose(
-            position=Point(x=-0.01, y=0.0, z=0.20),
-            orientation=Quaternion(
-                x=1.0, y=0.0, z=0.0, w=0.0)
-        )
-
-        pour_pose = Pose(
-            position=Point(x=0.01, y=-0.005, z=0.17),
-            orientation=Quaternion(
-                x=0.9452608, y=0.0, z=-0.3150869, w=-0.0848662)
-        )
-        # transform to spout
-        approach_pose = tf2_geometry_msgs.do_transform_pose(
-            approach_pose, tf)
-        pour_pose = tf2_geometry_msgs.do_transform_pose(pour_pose, tf)
-
-        # transform to pot_top
-        approach_pose = tf2_geometry_msgs.do_transform_pose(
-            approach_pose, pot_top_tf)
-        pour_pose = tf2_geometry_msgs.do_transform_pose(pour_pose, pot_top_tf)
-
-        # Pour 1
-        result = await self.moveit_api.plan_async(
-            point=approach_pose.position,
-            orientation=approach_pose.orientation,
-            execute=True
-        )
-
-        result = await self.moveit_api.plan_async(
-            point=pour_pose.position,
-            orientation=pour_pose.orientation,
-            execute=True
-        )
-
-        goal_msg = PourAction.Goal(
-            num_points=100,
-            spiral_radius=0.02,
-            num_loops=2.0,
-            start_outside=True,
-            pour_frame="panda_hand_tcp",
-        )
-        result = await self.pour_kettle.send_goal_async(goal_msg)
-        res = await result.get_result_async()
+        # transform to spout, then to pot_top
+        spout_to_base = tf_to_mat(pot_top_tf) @ self.spout_mat
+        approach_pose = transform_pose(self.pour_approach_pose, spout_to_base)
+        pour_pose = transform_pose(self.pour_pose, spout_to_base)
 
         result = await self.moveit_api.plan_async(
             point=approach_pose.position,
             orientation=approach_pose.orientation,
             execute=True
         )
-        await self.delay_client.call_async(DelayTime.Request(time=1.0))
 
-        # Pour 2
-        result = await self.moveit_api.plan_async(
-            point=approach_pose.position,
-            orientation=approach_pose.orientation,
-            execute=True
-        )
-
-        result = await self.moveit_api.plan_async(
-            point=pour_pose.position,
-            orientation=pour_pose.orientation,
-            execute=True
-        )
-
-        goal_msg = PourAction.Goal(
-            num_points=100,
-            spiral_radius=0.02,
-            num_loops=2.0,
-            start_outside=False,
-            pour_frame="panda_hand_tcp",
-        )
-        result = await self.pour_kettle.send_goal_async(goal_msg)
-        res = await result.get_result_async()
-
-        result = await self.moveit_api.plan_async(
-            point=approach_pose.position,
-            orientation=approach_pose.orientation,
-            execute=True
-        )
-        await self.delay_client.call_async(DelayTime.Request(time=1.0))
-
-        # Pour 3
-        result = await self.moveit_api.plan_async(
-            point=approach_pose.position,
-            orientation=approach_pose.orientation,
-            execute=True
-        )
-
-        result = await self.moveit_api.plan_async(
-            point=pour_pose.position,
-            orientation=pour_pose.orientation,
-            execute=True
-        )
-
-        goal_msg = PourAction.Goal(
-            num_points=100,
-            spiral_radius=0.02,
-            num_loops=2.0,
-            start_outside=False,
-            pour_frame="panda_hand_tcp",
-        )
-        result = await self.pour_kettle.send_goal_async(goal_msg)
-        res = await result.get_result_async()
-
-        result = await self.moveit_api.plan_async(
-            point=approach_pose.position,
-            orientation=approach_pose.orientation,
-            execute=True
-        )
-        await self.delay_client.call_async(DelayTime.Request(time=1.0))
-
-        # Pour 4
-        result = await self.moveit_api.plan_async(
-            point=approach_pose.position,
-            orientation=approach_pose.orientation,
-            execute=True
-        )
-
-        result = await self.moveit_api.plan_async(
-            point=pour_pose.position,
-            orientation=pour_pose.orientation,
-            execute=True
-        )
-
-        goal_msg = PourAction.Goal(
-            num_points=100,
-            spiral_radius=0.02,
-            num_loops=2.0,
-            start_outside=False,
-            pour_frame="panda_hand_tcp",
-        )
-        result = await self.pour_kettle.send_goal_async(goal_msg)
-        res = await result.get_result_async()
-
-        result = await self.moveit_api.plan_async(
-            point=approach_pose.position,
-            orientation=approach_pose.orientation,
-            execute=True
-        )
+        # Every pour starts and ends at the approach pose, so the approach -> pour
+        # motion is replayed as long as the arm returns to the same joint state
+        pour_traj = None
+        pours = [_POUR_GOAL_OUT, _POUR_GOAL_IN, _POUR_GOAL_IN, _POUR_GOAL_IN]
+        for i, goal_msg in enumerate(pours):
+            if pour_traj is None or not self.at_trajectory_start(pour_traj):
+                result = await self.moveit_api.plan_async(
+                    point=pour_pose.position,
+                    orientation=pour_pose.orientation,
+                    execute=False
+                )
+                pour_traj = result.trajectory
+
+            if not await self.execute(pour_traj):
+                self.get_logger().warn("Cached pour trajectory failed, replanning")
+                pour_traj = None
+                result = await self.moveit_api.plan_async(
+                    point=pour_pose.position,
+                    orientation=pour_pose.orientation,
+                    execute=True
+                )
+
+            result = await self.pour_kettle.send_goal_async(goal_msg)
+            res = await result.get_result_async()
+
+            result = await self.moveit_api.plan_async(
+                point=approach_pose.position,
+                orientation=approach_pose.orientation,
+                execute=True
+            )
+            if i < len(pours) - 1:
+                await sleep_for(self, 1.0, self.client_grp)
 
         goal_handle.succeed()
         return EmptyAction.Result()
@@ -358,6 +493,11 @@ class Kettle(Node):
 
 def kettle_entry(args=None):
     rclpy.init(args=args)
+    # run the pour_action server in the same process as its only client
+    pouring = Pouring()
     kettle = Kettle()
-    rclpy.spin(kettle)
+    executor = MultiThreadedExecutor(num_threads=4)
+    executor.add_node(pouring)
+    executor.add_node(kettle)
+    executor.spin()
     rclpy.shutdown()
@@ -37,6 +37,7 @@ from botrista_interfaces.action import EmptyAction, GraspProcess
 from botrista_interfaces.srv import DelayTime
 from rclpy.action import ActionServer, ActionClient
 from std_msgs.msg import Header
+from botrista.transforms import tf_to_mat, transform_pose
 import numpy as np
 
 
@@ -255,24 +256,13 @@ class Pot(Node):
             position=Point(x=0.0, y=-0.1, z=0.5),
             orientation=Quaternion(x=-0.5, y=-0.5, z=0.5, w=-0.50),
         )
-        retreat_pose = tf2_geometry_msgs.do_transform_pose(retreat_pose, spout_tf)
-        retreat_pose = tf2_geometry_msgs.do_transform_pose(retreat_pose, cup_tf)
 
-        # Transform to spout
-        spout_approach_pose = tf2_geometry_msgs.do_transform_pose(
-            cup_tf_approach_pose, spout_tf
-        )
-        spout_pour_pose = tf2_geometry_msgs.do_transform_pose(
-            cup_tf_pour_pose, spout_tf
-        )
-        spout_pour_pose_2 = tf2_geometry_msgs.do_transform_pose(
-            cup_tf_pour_pose_2, spout_tf
-        )
-
-        # Transform to cup
-        approach_pose = tf2_geometry_msgs.do_transform_pose(spout_approach_pose, cup_tf)
-        pour_pose = tf2_geometry_msgs.do_transform_pose(spout_pour_pose, cup_tf)
-        pour_pose_2 = tf2_geometry_msgs.do_transform_pose(spout_pour_pose_2, cup_tf)
+        # Transform to spout, then to cup
+        spout_to_base = tf_to_mat(cup_tf) @ tf_to_mat(spout_tf)
+        retreat_pose = transform_pose(retreat_pose, spout_to_base)
+        approach_pose = transform_pose(cup_tf_approach_pose, spout_to_base)
+        pour_pose = transform_pose(cup_tf_pour_pose, spout_to_base)
+        pour_pose_2 = transform_pose(cup_tf_pour_pose_2, spout_to_base)
 
         # rotate handle
         joint_states = self.moveit_api.get_current_joint_state()
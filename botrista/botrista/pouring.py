@@ -9,7 +9,8 @@ Action Servers:
 
 import rclpy
 from rclpy.node import Node
-import math
+from rclpy.executors import MultiThreadedExecutor
+import numpy as np
 from rclpy.callback_groups import ReentrantCallbackGroup
 from tf2_ros import TransformException
 from tf2_ros.transform_listener import TransformListener
@@ -36,6 +37,9 @@ class Pouring(Node):
         self.tf_listener = TransformListener(self.tf_buffer, self)
         self.tf_parent_frame = "panda_link0"
 
+        # Spiral offsets keyed by (num_points, spiral_radius, num_loops, start_outside)
+        self.spiral_cache = {}
+
         # Moveit Wrapper Object
         self.moveit = MoveItApi(self,
                                 "panda_link0",
@@ -86,12 +90,12 @@ class Pouring(Node):
         # Calculating path
         feedback.stage = "Calculating path"
         goal_handle.publish_feedback(feedback)
-        waypoints = get_spiral_waypoints(startPoint,
+        key = (req.num_points, req.spiral_radius, req.num_loops, req.start_outside)
+        if key not in self.spiral_cache:
+            self.spiral_cache[key] = get_spiral_offsets(*key)
+        waypoints = offsets_to_waypoints(startPoint,
                                          startOre,
-                                         req.num_points,
-                                         req.spiral_radius,
-                                         req.num_loops,
-                                         req.start_outside)
+                                         self.spiral_cache[key])
 
         # Planning
         feedback.stage = "Planning path"
@@ -111,7 +115,9 @@ class Pouring(Node):
 def main(args=None):
     rclpy.init(args=args)
     node = Pouring()
-    rclpy.spin(node)
+    executor = MultiThreadedExecutor(num_threads=4)
+    executor.add_node(node)
+    executor.spin()
     rclpy.shutdown()
 
 
@@ -136,29 +142,62 @@ def get_spiral_waypoints(startPoint: Point,
         A list of waypoints
 
     """
-    count = 0
-    thTotal = loops*2*math.pi
-    thStep = thTotal/numPoints
-    b = maxRadius/2/math.pi/loops
+    offsets = get_spiral_offsets(numPoints, maxRadius, loops, flipStart)
+    return offsets_to_waypoints(startPoint, startOre, offsets)
 
-    # Create poses for each point along the spiral
-    poseList = []
-    while count < numPoints:
-        # Calculating new point
-        th = count*thStep
-        r = th*b
-        x_n = r*math.cos(th) + startPoint.x
-        y_n = r*math.sin(th) + startPoint.y
-        z_n = startPoint.z
-
-        poseList.append(Pose(position=Point(x=x_n,
-                                            y=y_n,
-                                            z=z_n),
-                             orientation=startOre))
-
-        count += 1
 
+def get_spiral_offsets(numPoints: int,
+                       maxRadius: float,
+                       loops: float,
+                       flipStart: bool = False) -> (np.ndarray, np.ndarray):
+    """
+    Create a spiral path around the origin
+
+    Args:
+        numPoints (int) -- number of points used to build the path
+        maxRadius (float) -- distance from end of spiral to origin in cm
+        loops (float) -- number of loops for the spiral to go through
+        flipStart (bool) -- Start at the end of the spiral instead of the center (default: {False})
+
+    Returns:
+        The x and y offsets of each point from the center of the spiral
+
+    """
+    thTotal = loops*2*np.pi
+    thStep = thTotal/numPoints
+    b = maxRadius/2/np.pi/loops
+
+    # Calculate every point along the spiral at once, walking inwards if flipped
+    idx = np.arange(numPoints)
     if flipStart:
-        poseList.reverse
+        idx = idx[::-1]
+    th = idx*thStep
+    r = th*b
+
+    return r*np.cos(th), r*np.sin(th)
+
+
+def offsets_to_waypoints(startPoint: Point,
+                         startOre: Quaternion,
+                         offsets: (np.ndarray, np.ndarray)) -> list[Pose]:
+    """
+    Create waypoints from spiral offsets around a starting point
+
+    Args:
+        startPoint (geometry_msgs/Point) -- Center of the spiral
+        startOre (geometry_msgs/Quaternion) -- Orientation of every waypoint
+        offsets (np.ndarray, np.ndarray) -- x and y offsets from get_spiral_offsets
+
+    Returns:
+        A list of waypoints
 
-    return poseList
+    """
+    xs = offsets[0] + startPoint.x
+    ys = offsets[1] + startPoint.y
+
+    # Create poses for each point along the spiral
+    return [Pose(position=Point(x=float(x),
+                                y=float(y),
+                                z=startPoint.z),
+                 orientation=startOre)
+            for x, y in zip(xs, ys)]
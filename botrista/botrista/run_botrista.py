@@ -173,16 +173,25 @@ class Botrista(Node):
         # 6. Pick up Kettle (pick_kettle action)
         goal6 = EmptyAction.Goal()
         result = await self.action_client_pick_kettle.send_goal_async(goal6)
+        if not result.accepted:
+            self.get_logger().error("pick_kettle goal rejected")
+            return
         await result.get_result_async()
 
         # # 7. Pour water from kettle (pour_action action)
         goal7 = EmptyAction.Goal()
         result = await self.action_client_pour_kettle.send_goal_async(goal7)
+        if not result.accepted:
+            self.get_logger().error("pour_kettle goal rejected")
+            return
         await result.get_result_async()
 
         # 8. Place Kettle on kettle stand (place_kettle action)
         goal8 = EmptyAction.Goal()
         result = await self.action_client_place_kettle.send_goal_async(goal8)
+        if not result.accepted:
+            self.get_logger().error("place_kettle goal rejected")
+            return
         await result.get_result_async()
         await self.moveit_api.go_home()
         await self.delay_client.call_async(DelayTime.Request(time=10.0))
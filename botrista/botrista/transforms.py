@@ -0,0 +1,136 @@
+"""
+Helpers for applying transforms to poses as 4x4 homogeneous matrices.
+
+Composing a chain of transforms into a single matrix means each pose only
+has to be transformed once, instead of once per link in the chain.
+"""
+
+
+from functools import lru_cache
+import numpy as np
+from scipy.spatial.transform import Rotation
+from geometry_msgs.msg import Pose, Point, Quaternion, TransformStamped
+
+
+def is_identity(q: Quaternion) -> bool:
+    """
+    Check if a quaternion is the identity rotation.
+
+    A zero quaternion counts as the identity, matching tf2_geometry_msgs.
+
+    Args:
+        q (geometry_msgs/Quaternion) -- quaternion to check
+
+    Returns:
+        True if the quaternion does not rotate
+
+    """
+    return q.x == 0.0 and q.y == 0.0 and q.z == 0.0 and q.w in (0.0, 1.0, -1.0)
+
+
+def quat_to_mat(q: Quaternion) -> np.ndarray:
+    """
+    Convert a quaternion to a rotation matrix.
+
+    A zero quaternion is treated as the identity, matching tf2_geometry_msgs.
+
+    Args:
+        q (geometry_msgs/Quaternion) -- quaternion to convert
+
+    Returns:
+        A read-only 3x3 rotation matrix
+
+    """
+    return _quat_to_mat(q.x, q.y, q.z, q.w)
+
+
+@lru_cache(maxsize=64)
+def _quat_to_mat(x: float, y: float, z: float, w: float) -> np.ndarray:
+    quat = [x, y, z, w]
+    if np.dot(quat, quat) < np.finfo(np.float64).eps:
+        mat = np.identity(3)
+    else:
+        mat = Rotation.from_quat(quat).as_matrix()
+
+    # the same matrix is returned for every call with this quaternion
+    mat.setflags(write=False)
+    return mat
+
+
+def tf_to_mat(tf: TransformStamped) -> np.ndarray:
+    """
+    Convert a transform to a homogeneous transformation matrix.
+
+    Args:
+        tf (geometry_msgs/TransformStamped) -- transform to convert
+
+    Returns:
+        A 4x4 transformation matrix
+
+    """
+    trans = tf.transform.translation
+    mat = np.identity(4)
+    mat[:3, :3] = quat_to_mat(tf.transform.rotation)
+    mat[:3, 3] = [trans.x, trans.y, trans.z]
+    return mat
+
+
+def pose_to_mat(pose: Pose) -> np.ndarray:
+    """
+    Convert a pose to a homogeneous transformation matrix.
+
+    Args:
+        pose (geometry_msgs/Pose) -- pose to convert
+
+    Returns:
+        A 4x4 transformation matrix
+
+    """
+    pos = pose.position
+    mat = np.identity(4)
+    mat[:3, :3] = quat_to_mat(pose.orientation)
+    mat[:3, 3] = [pos.x, pos.y, pos.z]
+    return mat
+
+
+def mat_to_pose(mat: np.ndarray) -> Pose:
+    """
+    Convert a homogeneous transformation matrix to a pose.
+
+    Args:
+        mat (np.ndarray) -- 4x4 transformation matrix
+
+    Returns:
+        The equivalent geometry_msgs/Pose
+
+    """
+    x, y, z, w = Rotation.from_matrix(mat[:3, :3]).as_quat()
+    return Pose(position=Point(x=float(mat[0, 3]),
+                               y=float(mat[1, 3]),
+                               z=float(mat[2, 3])),
+                orientation=Quaternion(x=float(x),
+                                       y=float(y),
+                                       z=float(z),
+                                       w=float(w)))
+
+
+def transform_pose(pose: Pose, mat: np.ndarray) -> Pose:
+    """
+    Apply a transformation matrix to a pose.
+
+    Args:
+        pose (geometry_msgs/Pose) -- pose to transform
+        mat (np.ndarray) -- 4x4 transformation matrix, e.g. from tf_to_mat
+
+    Returns:
+        The transformed geometry_msgs/Pose
+
+    """
+    if not is_identity(pose.orientation):
+        return mat_to_pose(mat @ pose_to_mat(pose))
+
+    # with no rotation in the pose only its position needs transforming
+    pos = pose.position
+    res = np.array(mat)
+    res[:3, 3] = mat[:3, :3] @ [pos.x, pos.y, pos.z] + mat[:3, 3]
+    return mat_to_pose(res)
@@ -18,10 +18,9 @@ Description:
         - delay_node
         - grasp_node
         - handle_detector
-        - kettle
+        - kettle (also runs pouring in the same process)
         - pick_filter
         - pot
-        - pouring
         - run_botrista
     It also runs the following additional launch files:
         - realsense.launch.py
@@ -79,10 +78,6 @@ def generate_launch_description():
             package="botrista",
             executable="pick_filter"
         ),
-        Node(
-            package="botrista",
-            executable="pouring"
-        ),
         Node(
             package="botrista",
             executable="handle_detector"
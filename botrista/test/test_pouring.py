@@ -0,0 +1,20 @@
+from botrista.pouring import get_spiral_waypoints
+from geometry_msgs.msg import Point, Quaternion
+import numpy as np
+
+
+def test_spiral_flip_start():
+
+    # Test that flipping the start walks the same spiral from the outside in
+    start = Point(x=1.0, y=2.0, z=3.0)
+    ore = Quaternion(x=1.0, y=0.0, z=0.0, w=0.0)
+    forward = get_spiral_waypoints(start, ore, 100, 0.02, 2.0)
+    flipped = get_spiral_waypoints(start, ore, 100, 0.02, 2.0, True)
+
+    assert len(forward) == len(flipped) == 100
+    for a, b in zip(forward, reversed(flipped)):
+        assert np.isclose(a.position.x, b.position.x)
+        assert np.isclose(a.position.y, b.position.y)
+        assert a.position.z == b.position.z
+    assert np.isclose(flipped[-1].position.x, start.x)
+    assert np.isclose(flipped[-1].position.y, start.y)
@@ -0,0 +1,48 @@
+from botrista.transforms import tf_to_mat, transform_pose
+from geometry_msgs.msg import (
+    Pose, Point, Quaternion, TransformStamped, Transform, Vector3
+)
+import numpy as np
+
+
+def test_composed_transform():
+
+    # Test that a composed transform matches applying each transform in turn
+    rot_z = TransformStamped(transform=Transform(
+        translation=Vector3(x=1.0, y=0.0, z=0.0),
+        rotation=Quaternion(x=0.0, y=0.0, z=np.sqrt(0.5), w=np.sqrt(0.5))))
+    offset = TransformStamped(transform=Transform(
+        translation=Vector3(x=-0.23, y=0.0, z=0.02),
+        rotation=Quaternion()))
+    pose = Pose(position=Point(x=0.1, y=0.2, z=0.3), orientation=Quaternion())
+
+    chained = transform_pose(transform_pose(pose, tf_to_mat(offset)),
+                             tf_to_mat(rot_z))
+    composed = transform_pose(pose, tf_to_mat(rot_z) @ tf_to_mat(offset))
+
+    expected = [1.0 - 0.2, -0.13, 0.32]
+    for p in (chained, composed):
+        assert np.allclose([p.position.x, p.position.y, p.position.z],
+                           expected)
+        assert np.allclose(np.abs([p.orientation.z, p.orientation.w]),
+                           [np.sqrt(0.5), np.sqrt(0.5)])
+
+
+def test_identity_orientation():
+
+    # Test that zero and unit-w orientations give the same transformed pose
+    tf = TransformStamped(transform=Transform(
+        translation=Vector3(x=0.5, y=-0.5, z=1.0),
+        rotation=Quaternion(x=1.0, y=0.0, z=0.0, w=0.0)))
+    zero = Pose(position=Point(x=0.1, y=0.2, z=0.3), orientation=Quaternion())
+    unit = Pose(position=Point(x=0.1, y=0.2, z=0.3),
+                orientation=Quaternion(w=1.0))
+    rotated = Pose(position=Point(x=0.1, y=0.2, z=0.3),
+                   orientation=Quaternion(x=0.0, y=0.0, z=1e-9, w=1.0))
+
+    for pose in (zero, unit, rotated):
+        p = transform_pose(pose, tf_to_mat(tf))
+        assert np.allclose([p.position.x, p.position.y, p.position.z],
+                           [0.6, -0.7, 0.7])
+        assert np.allclose(np.abs([p.orientation.x, p.orientation.w]),
+                           [1.0, 0.0])